@@ -1,17 +1,36 @@
 #!/usr/bin/env python3
+import argparse
+import functools
 import glob
+import mmap
 import os
 import sys
 import subprocess
-from smbus2 import SMBus, i2c_msg
+import time
+from concurrent.futures import ThreadPoolExecutor
+from smbus2 import I2cFunc, SMBus, i2c_msg
 
 WM8960_ADDR = 0x1A  # default; can be overridden at runtime
 
+BULK_WRITE_CHUNK = 32  # messages per i2c_rdwr ioctl
+
+PROBE_INTERVAL = 0.1  # seconds between presence polls
+PROBE_TIMEOUT_MS = 400  # default; override with WM8960_PROBE_TIMEOUT_MS
+PROBE_WORKERS = 8  # buses probed in parallel by choose_bus()
+
+# (bus_num, addr) -> (time.monotonic() of probe, whether the address ACKed)
+PROBE_CACHE_TTL = 5.0
+_probe_cache: dict[tuple[int, int], tuple[float, bool]] = {}
+
+USB_CACHE_TTL = 10.0
+_usb_cache_ts = float("-inf")
+
 HELP_TEXT = """Commands:
   list                     - list loaded registers with current values
   set <idx> <value>        - set register at list index to value (hex or dec)
   write <idx>              - write the current value of register at index
   writeall                 - write all registers in the list
+  diff                     - list registers whose value differs from default
   writeaddr <addr> <val>   - direct write by register address (hex or dec)
   setaddr <addr> <val>     - update cached value by register address
   macro <name>             - run a predefined write sequence
@@ -38,17 +57,54 @@ def discover_i2c_buses():
     return sorted(set(buses))
 
 
-def probe_bus_for_wm8960(bus_num: int) -> str:
-    """Lightweight probe for WM8960 address on a given bus; returns a hint string."""
+def probe_bus_for_wm8960(
+    bus_num: int,
+    hit_max_age: float = PROBE_CACHE_TTL,
+    miss_max_age: float = PROBE_CACHE_TTL,
+) -> str:
+    """Lightweight probe for WM8960 address on a given bus; returns a hint string.
+
+    ACK results are cached per (bus_num, addr). A cached hit is reused while
+    younger than hit_max_age, a cached miss (both addresses) while younger
+    than miss_max_age; pass miss_max_age=0 to always re-probe on a miss.
+    """
+    for addr in (0x1A, 0x1B):
+        if _cached_ack(bus_num, addr, hit_max_age):
+            return f"(device responded at 0x{addr:02x})"
+    if all(_cached_ack(bus_num, addr, miss_max_age) is False for addr in (0x1A, 0x1B)):
+        return ""
+    return _probe_bus_uncached(bus_num)
+
+
+def _probe_timeout() -> float:
+    """Probe retry window in seconds, from WM8960_PROBE_TIMEOUT_MS if set."""
+    raw = os.environ.get("WM8960_PROBE_TIMEOUT_MS", "")
+    try:
+        return max(0, int(raw)) / 1000.0
+    except ValueError:
+        return PROBE_TIMEOUT_MS / 1000.0
+
+
+def _probe_bus_uncached(bus_num: int) -> str:
+    # Poll so a codec or USB-I2C adapter that is still coming up on boot isn't
+    # reported absent; returns as soon as either address ACKs.
+    deadline = time.monotonic() + _probe_timeout()
     try:
         with SMBus(bus_num) as bus:
-            for addr in (0x1A, 0x1B):
-                try:
-                    # Use SMBus quick write for presence detection (matches i2cdetect).
-                    bus.write_quick(addr)
+            while True:
+                for addr in (0x1A, 0x1B):
+                    try:
+                        # Use SMBus quick write for presence detection (matches i2cdetect).
+                        bus.write_quick(addr)
+                    except OSError:
+                        _record_ack(bus_num, addr, False)
+                        continue
+                    _record_ack(bus_num, addr, True)
                     return f"(device responded at 0x{addr:02x})"
-                except OSError:
-                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(min(PROBE_INTERVAL, remaining))
     except PermissionError:
         return "(no access; try sudo or add user to i2c group)"
     except FileNotFoundError:
@@ -56,16 +112,66 @@ def probe_bus_for_wm8960(bus_num: int) -> str:
     return ""
 
 
+def _cached_ack(bus_num: int, addr: int, max_age: float = PROBE_CACHE_TTL):
+    """True/False if a probe result younger than max_age exists for addr, else None."""
+    cached = _probe_cache.get((bus_num, addr))
+    if cached is None or time.monotonic() - cached[0] >= max_age:
+        return None
+    return cached[1]
+
+
+def _record_ack(bus_num: int, addr: int, acked: bool):
+    _probe_cache[(bus_num, addr)] = (time.monotonic(), acked)
+
+
 def list_usb_devices():
-    """Return lsusb output as list of lines."""
+    """
+    Return USB devices as list of lsusb-style lines.
+    Results are cached for USB_CACHE_TTL seconds.
+    """
+    global _usb_cache_ts
+    now = time.monotonic()
+    if now - _usb_cache_ts >= USB_CACHE_TTL:
+        _list_usb_devices_raw.cache_clear()
+        _usb_cache_ts = now
+    return list(_list_usb_devices_raw())
+
+
+@functools.lru_cache(maxsize=1)
+def _list_usb_devices_raw():
+    devices = _list_usb_devices_sysfs()
+    if devices:
+        return tuple(devices)
     try:
         out = subprocess.run(
             ["lsusb"], check=True, capture_output=True, text=True
         ).stdout.splitlines()
-        return [line.strip() for line in out if line.strip()]
+        return tuple(line.strip() for line in out if line.strip())
     except Exception as exc:  # pragma: no cover - env-specific
         print(f"Could not list USB devices: {exc}", file=sys.stderr)
-        return []
+        return ()
+
+
+def _list_usb_devices_sysfs():
+    """Read USB devices from /sys/bus/usb/devices on Linux; no subprocess needed."""
+    devices = []
+    for vendor_path in sorted(glob.glob("/sys/bus/usb/devices/*/idVendor")):
+        dev_dir = os.path.dirname(vendor_path)
+        fields = {}
+        for key in ("idVendor", "idProduct", "manufacturer", "product", "busnum", "devnum"):
+            try:
+                with open(os.path.join(dev_dir, key), "r", encoding="utf-8") as f:
+                    fields[key] = f.read().strip()
+            except OSError:
+                fields[key] = ""
+        try:
+            bus_dev = f"Bus {int(fields['busnum']):03d} Device {int(fields['devnum']):03d}: "
+        except ValueError:
+            bus_dev = ""
+        desc = " ".join(p for p in (fields["manufacturer"], fields["product"]) if p)
+        line = f"{bus_dev}ID {fields['idVendor']}:{fields['idProduct']} {desc}"
+        devices.append(line.strip())
+    return devices
 
 
 def choose_usb_device():
@@ -87,41 +193,73 @@ def choose_usb_device():
         sys.exit(1)
 
 
-def scan_bus(bus_num: int):
+def scan_bus(bus_num: int, probe_addrs=(0x1A, 0x1B), full_scan: bool = False):
     """
-    Rough equivalent of `i2cdetect -y <bus>`.
-    Uses SMBus quick write to test for ACK; prints a 16x16 grid.
+    Rough equivalent of `i2cdetect -y <bus>`, printed as a 16x16 grid.
+    By default only probe_addrs (the WM8960 addresses 0x1a/0x1b) are checked,
+    reusing fresh cached probe results and quick-writing the rest; every other
+    cell shows "--" without touching the bus. Pass full_scan=True to ACK-test
+    every valid address. Fresh results are recorded in the probe cache.
     """
-    print(f"\nScanning /dev/i2c-{bus_num} for devices (ACK test)...")
+    if full_scan:
+        targets = set(range(0x03, 0x78))
+        print(f"\nScanning /dev/i2c-{bus_num} for devices (full ACK test)...")
+    else:
+        targets = set(probe_addrs)
+        listed = ", ".join(f"0x{a:02x}" for a in sorted(targets))
+        print(f"\nProbing /dev/i2c-{bus_num} at {listed} (use --full-scan for all)...")
+
     header = "     " + " ".join(f"{col:x}" for col in range(16))
-    print(header)
-    try:
-        with SMBus(bus_num) as bus:
-            for row in range(8):  # 0x00-0x7f valid 7-bit addresses
-                base = row * 16
-                line = f"{base:02x}: "
-                for col in range(16):
-                    addr = base + col
-                    if addr < 0x03 or addr > 0x77:
-                        line += "   "
-                        continue
+    found = set()
+    pending = []
+    for addr in sorted(targets):
+        if addr < 0x03 or addr > 0x77:
+            continue
+        acked = None if full_scan else _cached_ack(bus_num, addr)
+        if acked is None:
+            pending.append(addr)
+        elif acked:
+            found.add(addr)
+    if pending:
+        try:
+            with SMBus(bus_num) as bus:
+                for addr in pending:
                     try:
                         # Presence check; avoids writing data to device registers.
                         bus.write_quick(addr)
-                        line += f"{addr:02x} "
                     except OSError:
-                        line += "-- "
-                print(line.rstrip())
-    except PermissionError:
-        print("Permission denied opening the bus; try sudo or add user to i2c group.")
-    except FileNotFoundError:
-        print(f"/dev/i2c-{bus_num} not found.")
+                        _record_ack(bus_num, addr, False)
+                        continue
+                    _record_ack(bus_num, addr, True)
+                    found.add(addr)
+        except PermissionError:
+            print("Permission denied opening the bus; try sudo or add user to i2c group.")
+            return
+        except FileNotFoundError:
+            print(f"/dev/i2c-{bus_num} not found.")
+            return
+
+    print(header)
+    for row in range(8):  # 0x00-0x7f valid 7-bit addresses
+        base = row * 16
+        line = f"{base:02x}: "
+        for col in range(16):
+            addr = base + col
+            if addr < 0x03 or addr > 0x77:
+                line += "   "
+            elif addr in found:
+                line += f"{addr:02x} "
+            else:
+                line += "-- "
+        print(line.rstrip())
 
 
+@functools.lru_cache(maxsize=1)
 def list_i2c_adapters():
     """
     Return a list of (bus_num, description) tuples.
     Uses `i2cdetect -l` when available; falls back to /dev/i2c-*.
+    The result is memoized for the lifetime of the process.
     """
     adapters = []
     try:
@@ -164,8 +302,10 @@ def choose_bus():
 
     print("Scanning I2C buses for WM8960 (0x1a/0x1b)...")
     responding = []
-    for num, _ in adapters:
-        tag = probe_bus_for_wm8960(num)
+    # Each probe opens its own SMBus handle, so buses can be polled concurrently.
+    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as ex:
+        tags = list(ex.map(probe_bus_for_wm8960, [num for num, _ in adapters]))
+    for (num, _), tag in zip(adapters, tags):
         if "device responded" in tag:
             responding.append(num)
             print(f"  /dev/i2c-{num} {tag}")
@@ -221,54 +361,106 @@ def parse_register_file(path: str):
 
     opened = None
     for candidate in candidates:
-        if os.path.isfile(candidate):
-            opened = candidate
-            break
+        try:
+            fh = open(candidate, "rb")
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            print(f"Could not open register file {candidate}: {e}", file=sys.stderr)
+            return []
+        opened = candidate
+        break
 
     if opened is None:
         print(f"Register file not found: {path}", file=sys.stderr)
         return []
 
-    try:
-        with open(opened, "r", encoding="utf-8") as f:
-            for line in f:
-                stripped = line.strip()
-                if not stripped or stripped.startswith("#"):
-                    continue
-                parts = stripped.split()
-                if not parts:
-                    continue
+    with fh:
+        for raw in _iter_register_lines(fh):
+            line = raw.decode("utf-8")
+            parts = line.split()
+            try:
+                addr = int(parts[0], 0)
+            except ValueError:
+                print(f"Skipping line (bad addr): {line}")
+                continue
+            name = parts[1] if len(parts) > 1 else f"REG_{addr:02X}"
+            default = None
+            if len(parts) > 2:
                 try:
-                    addr = int(parts[0], 0)
+                    default = int(parts[2], 0)
                 except ValueError:
-                    print(f"Skipping line (bad addr): {line.strip()}")
-                    continue
-                name = parts[1] if len(parts) > 1 else f"REG_{addr:02X}"
-                default = None
-                if len(parts) > 2:
-                    try:
-                        default = int(parts[2], 0)
-                    except ValueError:
-                        pass
-                regs.append(
-                    {
-                        "addr": addr,
-                        "name": name,
-                        "default": default,
-                        "value": default if default is not None else 0,
-                    }
-                )
-        print(f"Loaded register file: {opened}")
-    except FileNotFoundError:
-        print(f"Register file not found: {opened}", file=sys.stderr)
-        return []
+                    pass
+            value = default if default is not None else 0
+            regs.append(
+                {
+                    "addr": addr,
+                    "name": name,
+                    "default": default,
+                    "value": value,
+                    # Cached wire bytes; refresh whenever "value" changes.
+                    "encoded": encode_register(addr, value),
+                }
+            )
+    print(f"Loaded register file: {opened}")
     return regs
 
 
-# Predefined macros: name -> list of (addr, value, comment)
+def _iter_register_lines(f):
+    """
+    Yield stripped (bytes) lines of a binary file object, skipping blank and
+    comment lines before anything is decoded. Line boundaries are found with
+    find() on a read-only mmap (prefaulted with MAP_POPULATE on Linux), so
+    comment lines are never copied out of the mapping. Falls back to plain
+    buffered reads where mmap is unavailable or the file is empty.
+    """
+    try:
+        if hasattr(mmap, "MAP_POPULATE"):
+            mm = mmap.mmap(
+                f.fileno(),
+                0,
+                flags=mmap.MAP_PRIVATE | mmap.MAP_POPULATE,
+                prot=mmap.PROT_READ,
+            )
+        else:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # Empty files can't be mapped; some platforms/filesystems refuse.
+        for line in f:
+            stripped = line.strip()
+            if stripped and not stripped.startswith(b"#"):
+                yield stripped
+        return
+    with mm:
+        size = len(mm)
+        pos = 0
+        while pos < size:
+            nl = mm.find(b"\n", pos)
+            end = size if nl == -1 else nl
+            start = pos
+            pos = end + 1
+            while start < end and mm[start] in b" \t\r\v\f":
+                start += 1
+            if start == end or mm[start] == 0x23:  # blank or "#" comment
+                continue
+            yield mm[start:end].rstrip()
+
+
+def encode_register(addr: int, value: int):
+    """Return the (high, low) byte pair the WM8960 expects for a 9-bit write."""
+    return ((addr & 0x7F) << 1) | ((value >> 8) & 0x1), value & 0xFF
+
+
+def _encode_macro(seq):
+    """Expand (addr, value, comment) steps to (addr, value, (high, low), comment)."""
+    return [(addr, val, encode_register(addr, val), desc) for addr, val, desc in seq]
+
+
+# Predefined macros: name -> list of (addr, value, (high, low), comment).
+# Wire bytes are encoded once at import since the sequences are constant.
 MACROS = {
-    "hp_i2s_init": [
-        (0xFH, 0x000, "Reset"),
+    "hp_i2s_init": _encode_macro([
+        (0x0F, 0x000, "Reset"),
         (0x19, 0x0C0, "Power1: VREF up + VMID=50k"),
         (0x1A, 0x1E0, "Power2: DACL/DACR + LOUT1/ROUT1 on"),
         (0x2F, 0x00C, "Power3: enable L/R output mixers"),
@@ -281,7 +473,7 @@ MACROS = {
         (0x05, 0x000, "Unmute DAC digital soft mute"),
         (0x07, 0x00E, "Audio IF: I2S slave, 32-bit (change for your width)"),
         (0x04, 0x000, "CLK1: SYSCLK from MCLK"),
-    ],
+    ]),
 }
 
 
@@ -294,31 +486,225 @@ def list_registers(regs):
         print(f"[{idx:02d}] 0x{reg['addr']:02X} 0x{reg['value']:03X} {reg['name']}")
 
 
-def write_register(bus: SMBus, addr: int, value: int):
-    high = ((addr & 0x7F) << 1) | ((value >> 8) & 0x1)
-    low = value & 0xFF
+def diff_registers(regs):
+    if not regs:
+        print("No registers loaded.")
+        return
+    changed = [
+        (idx, reg)
+        for idx, reg in enumerate(regs)
+        if reg["value"] != (reg["default"] if reg["default"] is not None else 0)
+    ]
+    if not changed:
+        print("All registers match their defaults.")
+        return
+    print("Idx  Addr  Default  Value  Name")
+    for idx, reg in changed:
+        default = f"0x{reg['default']:03X}" if reg["default"] is not None else "  ---"
+        print(f"[{idx:02d}] 0x{reg['addr']:02X} {default}   0x{reg['value']:03X} {reg['name']}")
+
+
+def write_encoded(bus: SMBus, encoded):
+    high, low = encoded
     bus.write_i2c_block_data(WM8960_ADDR, high, [low])
 
 
+def write_register(bus: SMBus, addr: int, value: int):
+    write_encoded(bus, encode_register(addr, value))
+
+
+def write_registers_bulk(bus: SMBus, pairs, chunk_size: int = BULK_WRITE_CHUNK):
+    """
+    Write pre-encoded (high, low) pairs as back-to-back I2C messages, one
+    i2c_rdwr ioctl per chunk. Adapters without plain-I2C support (SMBus-only
+    USB bridges) are written one register at a time instead, as is any chunk
+    the adapter rejects, so a failure is pinned to the exact register.
+    Returns (written, error): the number of pairs written before the first
+    failing register, and its OSError (or None).
+    """
+    pairs = list(pairs)
+    use_rdwr = bool(bus.funcs & I2cFunc.I2C)
+    written = 0
+    while written < len(pairs):
+        chunk = pairs[written:written + chunk_size]
+        if use_rdwr:
+            msgs = [i2c_msg.write(WM8960_ADDR, [high, low]) for high, low in chunk]
+            try:
+                bus.i2c_rdwr(*msgs)
+                written += len(chunk)
+                continue
+            except OSError:
+                # Unsupported transfer size or a NACK partway through; part of
+                # the chunk may have landed, so replay it (and the rest) one
+                # register at a time.
+                use_rdwr = False
+        for encoded in chunk:
+            try:
+                write_encoded(bus, encoded)
+            except OSError as e:
+                return written, e
+            written += 1
+    return written, None
+
+
 def write_reg(bus: SMBus, reg: int, value: int):
     # reg: 0–0x34, value: 0–0x1FF
-    high = ((reg & 0x7F) << 1) | ((value >> 8) & 0x1)
-    low = value & 0xFF
-    bus.write_i2c_block_data(WM8960_ADDR, high, [low])
+    write_encoded(bus, encode_register(reg, value))
 
 
 def read_reg(bus: SMBus, reg: int) -> int:
     # Some WM8960 variants don’t support reads; expect IOError if so.
-    addr_byte = (reg & 0x7F) << 1
-    bus.write_byte(WM8960_ADDR, addr_byte)  # set register pointer
-    data = bus.read_i2c_block_data(WM8960_ADDR, 0, 2)
+    # Set the register pointer and read back over a repeated START (one ioctl).
+    w = i2c_msg.write(WM8960_ADDR, [(reg & 0x7F) << 1])
+    r = i2c_msg.read(WM8960_ADDR, 2)
+    bus.i2c_rdwr(w, r)
+    data = list(r)
     return ((data[0] & 0x1) << 8) | data[1]
 
 
+def _cmd_help(bus, registers, parts):
+    print(HELP_TEXT)
+
+
+def _cmd_quit(bus, registers, parts):
+    return True
+
+
+def _cmd_list(bus, registers, parts):
+    list_registers(registers)
+
+
+def _cmd_diff(bus, registers, parts):
+    diff_registers(registers)
+
+
+def _cmd_set(bus, registers, parts):
+    try:
+        idx = int(parts[1])
+        val = int(parts[2], 0)
+    except (ValueError, IndexError):
+        print("Usage: set <idx> <value>")
+        return
+    if idx < 0 or idx >= len(registers):
+        print("Index out of range.")
+        return
+    registers[idx]["value"] = val & 0x1FF
+    registers[idx]["encoded"] = encode_register(registers[idx]["addr"], val & 0x1FF)
+    print(f"Set {registers[idx]['name']} to 0x{val:03X}")
+
+
+def _cmd_write(bus, registers, parts):
+    try:
+        idx = int(parts[1])
+    except (ValueError, IndexError):
+        print("Usage: write <idx>")
+        return
+    if idx < 0 or idx >= len(registers):
+        print("Index out of range.")
+        return
+    reg = registers[idx]
+    try:
+        write_encoded(bus, reg["encoded"])
+        print(f"Wrote 0x{reg['value']:03X} to 0x{reg['addr']:02X} ({reg['name']})")
+    except OSError as e:
+        print(f"Write failed: {e}")
+
+
+def _cmd_writeall(bus, registers, parts):
+    if not registers:
+        print("No registers loaded.")
+        return
+    written, err = write_registers_bulk(bus, [reg["encoded"] for reg in registers])
+    for reg in registers[:written]:
+        print(f"Wrote 0x{reg['value']:03X} to 0x{reg['addr']:02X} ({reg['name']})")
+    if err is not None:
+        print(f"Write failed for 0x{registers[written]['addr']:02X}: {err}")
+
+
+def _cmd_writeaddr(bus, registers, parts):
+    try:
+        addr = int(parts[1], 0)
+        val = int(parts[2], 0) & 0x1FF
+    except (ValueError, IndexError):
+        print("Usage: writeaddr <addr> <val>")
+        return
+    try:
+        write_register(bus, addr, val)
+        print(f"Wrote 0x{val:03X} to 0x{addr:02X}")
+    except OSError as e:
+        print(f"Write failed: {e}")
+
+
+def _cmd_setaddr(bus, registers, parts):
+    try:
+        addr = int(parts[1], 0)
+        val = int(parts[2], 0) & 0x1FF
+    except (ValueError, IndexError):
+        print("Usage: setaddr <addr> <val>")
+        return
+    # Update first matching register in list, if present.
+    for reg in registers:
+        if reg["addr"] == addr:
+            reg["value"] = val
+            reg["encoded"] = encode_register(addr, val)
+            print(f"Set {reg['name']} (0x{addr:02X}) to 0x{val:03X}")
+            return
+    print("Address not in loaded register list.")
+
+
+def _cmd_macro(bus, registers, parts):
+    if len(parts) < 2:
+        print(f"Usage: macro <name>. Available: {', '.join(MACROS.keys())}")
+        return
+    name = parts[1]
+    if name not in MACROS:
+        print(f"Unknown macro '{name}'. Available: {', '.join(MACROS.keys())}")
+        return
+    seq = MACROS[name]
+    print(f"Running macro '{name}' ({len(seq)} writes)")
+    lines = [f"  0x{addr:02X} <- 0x{val:03X} ({desc})" for addr, val, _, desc in seq]
+    written, err = write_registers_bulk(bus, [encoded for _, _, encoded, _ in seq])
+    for line in lines[:written]:
+        print(line)
+    if err is not None:
+        print(f"  Write failed at 0x{seq[written][0]:02X}: {err}")
+
+
+# REPL command -> handler(bus, registers, parts); a truthy return ends the session.
+HANDLERS = {
+    "help": _cmd_help,
+    "quit": _cmd_quit,
+    "exit": _cmd_quit,
+    "list": _cmd_list,
+    "diff": _cmd_diff,
+    "set": _cmd_set,
+    "write": _cmd_write,
+    "writeall": _cmd_writeall,
+    "writeaddr": _cmd_writeaddr,
+    "wa": _cmd_writeaddr,
+    "setaddr": _cmd_setaddr,
+    "sa": _cmd_setaddr,
+    "macro": _cmd_macro,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Interactive WM8960 register tool over Linux I2C."
+    )
+    parser.add_argument(
+        "--full-scan",
+        action="store_true",
+        help="ACK-test every I2C address at startup (default probes only 0x1a/0x1b)",
+    )
+    return parser.parse_args(argv)
+
+
 def main():
+    args = parse_args()
     bus_num = choose_bus()
     # Show a quick scan like `i2cdetect -y <bus>`.
-    scan_bus(bus_num)
+    scan_bus(bus_num, full_scan=args.full_scan)
 
     addr_input = input("Enter WM8960 I2C address (default 0x1a, alt 0x1b): ").strip()
     if addr_input:
@@ -328,9 +714,13 @@ def main():
         except ValueError:
             print("Invalid address; using default 0x1a.")
             WM8960_ADDR = 0x1A
+        if WM8960_ADDR not in (0x1A, 0x1B) and not args.full_scan:
+            # Not covered by the scan above; probe just the chosen address.
+            scan_bus(bus_num, probe_addrs=(WM8960_ADDR,))
 
-    # Final probe before writing.
-    tag = probe_bus_for_wm8960(bus_num)
+    # Final probe before writing. A hit from choose_bus()/scan_bus() is reused
+    # however long the prompts took; a miss is always re-probed.
+    tag = probe_bus_for_wm8960(bus_num, hit_max_age=float("inf"), miss_max_age=0)
     if "device responded" not in tag:
         cont = input(
             f"No WM8960 response on /dev/i2c-{bus_num}. Continue anyway? [y/N]: "
@@ -352,97 +742,11 @@ def main():
             if not cmd:
                 continue
             parts = cmd.split()
-            action = parts[0].lower()
-
-            if action in ("quit", "exit"):
-                break
-            if action == "help":
-                print(HELP_TEXT)
-            elif action == "list":
-                list_registers(registers)
-            elif action == "set" and len(parts) == 3:
-                try:
-                    idx = int(parts[1])
-                    val = int(parts[2], 0)
-                except ValueError:
-                    print("Usage: set <idx> <value>")
-                    continue
-                if idx < 0 or idx >= len(registers):
-                    print("Index out of range.")
-                    continue
-                registers[idx]["value"] = val & 0x1FF
-                print(f"Set {registers[idx]['name']} to 0x{val:03X}")
-            elif action == "write" and len(parts) == 2:
-                try:
-                    idx = int(parts[1])
-                except ValueError:
-                    print("Usage: write <idx>")
-                    continue
-                if idx < 0 or idx >= len(registers):
-                    print("Index out of range.")
-                    continue
-                reg = registers[idx]
-                try:
-                    write_register(bus, reg["addr"], reg["value"])
-                    print(f"Wrote 0x{reg['value']:03X} to 0x{reg['addr']:02X} ({reg['name']})")
-                except OSError as e:
-                    print(f"Write failed: {e}")
-            elif action == "writeall":
-                if not registers:
-                    print("No registers loaded.")
-                    continue
-                for reg in registers:
-                    try:
-                        write_register(bus, reg["addr"], reg["value"])
-                        print(f"Wrote 0x{reg['value']:03X} to 0x{reg['addr']:02X} ({reg['name']})")
-                    except OSError as e:
-                        print(f"Write failed for 0x{reg['addr']:02X}: {e}")
-                        break
-            elif action in ("writeaddr", "wa") and len(parts) == 3:
-                try:
-                    addr = int(parts[1], 0)
-                    val = int(parts[2], 0) & 0x1FF
-                except ValueError:
-                    print("Usage: writeaddr <addr> <val>")
-                    continue
-                try:
-                    write_register(bus, addr, val)
-                    print(f"Wrote 0x{val:03X} to 0x{addr:02X}")
-                except OSError as e:
-                    print(f"Write failed: {e}")
-            elif action in ("setaddr", "sa") and len(parts) == 3:
-                try:
-                    addr = int(parts[1], 0)
-                    val = int(parts[2], 0) & 0x1FF
-                except ValueError:
-                    print("Usage: setaddr <addr> <val>")
-                    continue
-                # Update first matching register in list, if present.
-                updated = False
-                for reg in registers:
-                    if reg["addr"] == addr:
-                        reg["value"] = val
-                        print(f"Set {reg['name']} (0x{addr:02X}) to 0x{val:03X}")
-                        updated = True
-                        break
-                if not updated:
-                    print("Address not in loaded register list.")
-            elif action == "macro" and len(parts) >= 2:
-                name = parts[1]
-                if name not in MACROS:
-                    print(f"Unknown macro '{name}'. Available: {', '.join(MACROS.keys())}")
-                    continue
-                seq = MACROS[name]
-                print(f"Running macro '{name}' ({len(seq)} writes)")
-                for addr, val, desc in seq:
-                    try:
-                        write_register(bus, addr, val)
-                        print(f"  0x{addr:02X} <- 0x{val:03X} ({desc})")
-                    except OSError as e:
-                        print(f"  Write failed at 0x{addr:02X}: {e}")
-                        break
-            else:
+            handler = HANDLERS.get(parts[0].lower())
+            if handler is None:
                 print("Unknown command. Type 'help' for options.")
+            elif handler(bus, registers, parts):
+                break
 
 
 if __name__ == "__main__":